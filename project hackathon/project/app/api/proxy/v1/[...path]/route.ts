@@ -0,0 +1,42 @@
+import { NextRequest, NextResponse } from "next/server"
+import { getCurrentUser } from "@/lib/auth"
+
+const API_URL = process.env.API_URL || "http://localhost:8000"
+
+// Forward browser calls to the backend, attaching the session's bearer token
+// since it lives in an httpOnly cookie the client can't read
+async function proxy(request: NextRequest, { params }: { params: { path: string[] } }) {
+  const user = await getCurrentUser()
+
+  const headers = new Headers()
+  const contentType = request.headers.get("content-type")
+  if (contentType) {
+    headers.set("content-type", contentType)
+  }
+  const accept = request.headers.get("accept")
+  if (accept) {
+    headers.set("accept", accept)
+  }
+  if (user?.token) {
+    headers.set("authorization", `Bearer ${user.token}`)
+  }
+
+  const hasBody = request.method !== "GET" && request.method !== "HEAD"
+  const response = await fetch(`${API_URL}/api/v1/${params.path.join("/")}${request.nextUrl.search}`, {
+    method: request.method,
+    headers,
+    body: hasBody ? await request.arrayBuffer() : undefined,
+    cache: "no-store",
+  })
+
+  // Stream the body through so server-sent events reach the browser as they arrive
+  return new NextResponse(response.body, {
+    status: response.status,
+    headers: {
+      "content-type": response.headers.get("content-type") || "application/json",
+      "cache-control": response.headers.get("cache-control") || "no-store",
+    },
+  })
+}
+
+export { proxy as GET, proxy as POST }
@@ -1,7 +1,8 @@
-from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form, Request
+from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any, Union
 import os
@@ -19,6 +20,14 @@ import time
 from deepface import DeepFace
 import asyncio
 import logging
+import hashlib
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import shutil
+import bisect
+from collections import deque, OrderedDict
 from pathlib import Path
 
 # Configure logging
@@ -35,6 +44,18 @@ if GEMINI_API_KEY:
 else:
     logger.warning("GEMINI_API_KEY not found in environment variables")
 
+# Gemini circuit breaker and hedging settings (latencies in seconds)
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "15"))
+GEMINI_BREAKER_WINDOW = int(os.getenv("GEMINI_BREAKER_WINDOW", "20"))
+GEMINI_BREAKER_MIN_CALLS = int(os.getenv("GEMINI_BREAKER_MIN_CALLS", "5"))
+GEMINI_BREAKER_ERROR_RATE = float(os.getenv("GEMINI_BREAKER_ERROR_RATE", "0.5"))
+GEMINI_BREAKER_P95_LATENCY = float(os.getenv("GEMINI_BREAKER_P95_LATENCY", "8"))
+GEMINI_BREAKER_COOLDOWN = float(os.getenv("GEMINI_BREAKER_COOLDOWN", "30"))
+GEMINI_HEDGE_ENABLED = os.getenv("GEMINI_HEDGE_ENABLED", "false").lower() == "true"
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "0.9"))
+GEMINI_CACHE_SIZE = int(os.getenv("GEMINI_CACHE_SIZE", "256"))
+GEMINI_MAX_WORKERS = int(os.getenv("GEMINI_MAX_WORKERS", "8"))
+
 app = FastAPI(
     title="VidyAI++ API",
     description="Backend API for VidyAI++ Education Platform",
@@ -52,6 +73,7 @@ app.add_middleware(
 
 # JWT Authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 1 week
@@ -111,6 +133,7 @@ class QuizRequest(BaseModel):
 class QuizResponse(BaseModel):
     questions: List[Dict[str, Any]]
     audio_prompts: Optional[Dict[str, str]] = None
+    audio_urls: Optional[Dict[str, str]] = None
 
 class VoiceCommandRequest(BaseModel):
     audio_data: str  # Base64 encoded audio
@@ -134,7 +157,7 @@ class MentorResponse(BaseModel):
 
 # Authentication functions
 def get_user(username: str):
-    users = load_json_data("students.json") + load_json_data("mentors.json")
+    users = load_json_data("students.json") + load_json_data("mentors.json") + load_json_data("schools.json")
     for user in users:
         if user.get("username") == username:
             return UserInDB(**user)
@@ -177,10 +200,145 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         raise credentials_exception
     return user
 
+async def get_optional_user(token: Optional[str] = Depends(optional_oauth2_scheme)):
+    # For endpoints that also serve anonymous callers
+    if not token:
+        return None
+    try:
+        return await get_current_user(token)
+    except HTTPException:
+        return None
+
+async def get_current_admin(current_user: User = Depends(get_current_user)):
+    # School accounts own the admin dashboard
+    if current_user.role != "school":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return current_user
+
 # Helper functions
 def get_syllabus_map():
     return load_json_data("syllabus_map.json")
 
+# Student roster with prebuilt secondary indexes
+ROSTER_INDEXED_FIELDS = ["region", "class_level", "preferred_language"]
+ROSTER_DEFAULT_FIELDS = ["id", "name", "region", "class_level", "preferred_language"]
+ROSTER_ALLOWED_FIELDS = {
+    "mentor": ["id", "name", "role", "region", "class_level", "preferred_language", "disabled"],
+    "school": ["id", "username", "name", "role", "region", "class_level", "preferred_language", "disabled"]
+}
+
+def roster_index_key(value):
+    return str(value).strip().lower()
+
+class StudentRoster:
+    """Students sorted by id with a sorted position list per indexed value.
+
+    Filters intersect the position lists and the cursor is the last id seen,
+    so a page is a bisect plus a slice rather than a scan of the whole file.
+    """
+
+    def __init__(self, students):
+        self.students = sorted(students, key=lambda s: str(s.get("id", "")))
+        self.ids = [str(s.get("id", "")) for s in self.students]
+        self.indexes = {field: {} for field in ROSTER_INDEXED_FIELDS}
+        for position, student in enumerate(self.students):
+            for field in ROSTER_INDEXED_FIELDS:
+                if student.get(field) is None:
+                    continue
+                key = roster_index_key(student[field])
+                self.indexes[field].setdefault(key, []).append(position)
+
+    def get(self, student_id: str):
+        position = bisect.bisect_left(self.ids, student_id)
+        if position < len(self.ids) and self.ids[position] == student_id:
+            return self.students[position]
+        return None
+
+    def query(self, filters: Dict[str, Any], after_id: Optional[str], limit: int):
+        candidates = None
+        # Intersect smallest index first to keep the working set small
+        postings = []
+        for field, value in filters.items():
+            if value is None:
+                continue
+            postings.append(self.indexes[field].get(roster_index_key(value), []))
+        for positions in sorted(postings, key=len):
+            if candidates is None:
+                candidates = positions
+            else:
+                members = set(positions)
+                candidates = [p for p in candidates if p in members]
+        if candidates is None:
+            candidates = range(len(self.students))
+
+        start = 0
+        if after_id is not None:
+            after_position = bisect.bisect_right(self.ids, after_id)
+            start = bisect.bisect_left(candidates, after_position)
+
+        page = [self.students[p] for p in candidates[start:start + limit]]
+        has_more = start + limit < len(candidates)
+        return page, has_more, len(candidates)
+
+_roster_cache = {"mtime": None, "roster": None}
+
+def get_student_roster():
+    # Rebuild the indexes only when students.json changes on disk
+    students_path = DATA_DIR / "students.json"
+    mtime = students_path.stat().st_mtime_ns if students_path.exists() else None
+    if _roster_cache["roster"] is None or _roster_cache["mtime"] != mtime:
+        _roster_cache["roster"] = StudentRoster(load_json_data("students.json"))
+        _roster_cache["mtime"] = mtime
+    return _roster_cache["roster"]
+
+def encode_roster_cursor(student_id: str):
+    return base64.urlsafe_b64encode(student_id.encode("utf-8")).decode("ascii")
+
+def decode_roster_cursor(cursor: str):
+    try:
+        # validate=True rejects stray characters instead of silently dropping them
+        student_id = base64.b64decode(cursor.encode("ascii"), altchars=b"-_", validate=True).decode("utf-8")
+    except Exception:
+        student_id = ""
+    if not student_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    return student_id
+
+# Skill heatmap dimensions
+SKILL_SUBJECTS = ["Math", "Science", "Language", "History", "Geography"]
+SKILL_NAMES = ["Understanding", "Application", "Analysis", "Creation", "Evaluation"]
+
+def generate_skill_scores(count: int):
+    # Random scores between 30 and 100 for demo purposes, shaped
+    # (students, subjects, skills). In a real app, this would be calculated
+    # from actual performance data.
+    return np.random.randint(30, 100, size=(count, len(SKILL_SUBJECTS), len(SKILL_NAMES)))
+
+def summarize_skill_scores(scores):
+    # One vectorised pass over the whole page
+    subject_means = scores.mean(axis=2)
+    overall = subject_means.mean(axis=1)
+    strongest = subject_means.argmax(axis=1)
+    weakest = subject_means.argmin(axis=1)
+    return [
+        {
+            "overall": round(float(overall[i]), 1),
+            "strongest_subject": SKILL_SUBJECTS[strongest[i]],
+            "weakest_subject": SKILL_SUBJECTS[weakest[i]],
+            "subjects": {
+                subject: round(float(subject_means[i][j]), 1)
+                for j, subject in enumerate(SKILL_SUBJECTS)
+            }
+        }
+        for i in range(scores.shape[0])
+    ]
+
 def get_emotion_response(emotion: str, language: str = "english"):
     responses = {
         "sad": {
@@ -240,14 +398,279 @@ def get_emotion_response(emotion: str, language: str = "english"):
     
     return responses[emotion_key][language_key]
 
+# Fixed quiz feedback, pre-rendered to speech for every language at startup
+QUIZ_FEEDBACK_PROMPTS = {
+    "correct": {
+        "english": "That's correct! Well done!",
+        "telugu": "సరైన సమాధానం! చాలా బాగా చేశారు!",
+        "hindi": "सही जवाब! बहुत बढ़िया!"
+    },
+    "incorrect": {
+        "english": "That's not quite right. Let's try again.",
+        "telugu": "అది సరిగ్గా లేదు. మళ్లీ ప్రయత్నిద్దాం.",
+        "hindi": "यह बिल्कुल सही नहीं है। चलिए फिर से कोशिश करते हैं।"
+    }
+}
+
+def get_quiz_audio_prompts(request: QuizRequest):
+    language_key = request.language.lower()
+    if language_key not in QUIZ_FEEDBACK_PROMPTS["correct"]:
+        language_key = "english"
+    
+    return {
+        "intro": f"Welcome to your {request.subject} quiz on {request.topic}",
+        "correct": QUIZ_FEEDBACK_PROMPTS["correct"][language_key],
+        "incorrect": QUIZ_FEEDBACK_PROMPTS["incorrect"][language_key]
+    }
+
+def percentile(values, pct):
+    # Nearest-rank percentile, pct in [0, 1]
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct * len(ordered)) - 1))
+    return ordered[index]
+
+class CircuitBreaker:
+    """Trips on rolling error rate or p95 latency and probes once it cools down.
+
+    States are "closed" (calls flow), "open" (calls are short-circuited to the
+    fallback) and "half_open" (a single probe call decides whether to close).
+    The app runs on one event loop, so no locking is needed.
+    """
+
+    def __init__(self, name, window_size, min_calls, error_rate_threshold,
+                 latency_threshold, cooldown):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.latency_threshold = latency_threshold
+        self.cooldown = cooldown
+        self.samples = deque(maxlen=window_size)  # (latency, succeeded)
+        self.state = "closed"
+        self.opened_at = None
+        self.trip_reason = None
+        self.probe_in_flight = False
+        self.short_circuited = 0
+        self.hedged_requests = 0
+        self.trips = 0
+
+    def allow_request(self):
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+        if self.state == "half_open" and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        self.short_circuited += 1
+        return False
+
+    def release_probe(self):
+        # The probe ended without an outcome (e.g. it was cancelled), let the
+        # next request probe instead
+        self.probe_in_flight = False
+
+    def record_success(self, latency):
+        self.samples.append((latency, True))
+        if self.state == "half_open":
+            self._close()
+        else:
+            self._evaluate()
+
+    def record_failure(self, latency):
+        self.samples.append((latency, False))
+        if self.state == "half_open":
+            self._open("half-open probe failed")
+        else:
+            self._evaluate()
+
+    def latency_percentile(self, pct):
+        if len(self.samples) < self.min_calls:
+            return None
+        return percentile([latency for latency, _ in self.samples], pct)
+
+    def error_rate(self):
+        if not self.samples:
+            return 0.0
+        failures = sum(1 for _, succeeded in self.samples if not succeeded)
+        return failures / len(self.samples)
+
+    def _evaluate(self):
+        if self.state != "closed" or len(self.samples) < self.min_calls:
+            return
+        error_rate = self.error_rate()
+        if error_rate >= self.error_rate_threshold:
+            self._open(f"error rate {error_rate:.0%}")
+            return
+        p95 = self.latency_percentile(0.95)
+        if p95 is not None and p95 > self.latency_threshold:
+            self._open(f"p95 latency {p95:.2f}s")
+
+    def _open(self, reason):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.trip_reason = reason
+        self.probe_in_flight = False
+        self.trips += 1
+        logger.warning(f"Circuit breaker '{self.name}' opened: {reason}")
+
+    def _close(self):
+        self.state = "closed"
+        self.opened_at = None
+        self.trip_reason = None
+        self.probe_in_flight = False
+        # Start a fresh window so stale slow samples don't re-trip immediately
+        self.samples.clear()
+        logger.info(f"Circuit breaker '{self.name}' closed")
+
+    def snapshot(self):
+        retry_in = None
+        if self.state == "open":
+            retry_in = max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+        return {
+            "name": self.name,
+            "state": self.state,
+            "trip_reason": self.trip_reason,
+            "retry_in_seconds": retry_in,
+            "window_size": len(self.samples),
+            "error_rate": self.error_rate(),
+            "p50_latency": self.latency_percentile(0.5),
+            "p95_latency": self.latency_percentile(0.95),
+            "trips": self.trips,
+            "short_circuited": self.short_circuited,
+            "hedged_requests": self.hedged_requests,
+            "thresholds": {
+                "min_calls": self.min_calls,
+                "error_rate": self.error_rate_threshold,
+                "p95_latency": self.latency_threshold,
+                "cooldown_seconds": self.cooldown
+            }
+        }
+
+gemini_breaker = CircuitBreaker(
+    "gemini",
+    window_size=GEMINI_BREAKER_WINDOW,
+    min_calls=GEMINI_BREAKER_MIN_CALLS,
+    error_rate_threshold=GEMINI_BREAKER_ERROR_RATE,
+    latency_threshold=GEMINI_BREAKER_P95_LATENCY,
+    cooldown=GEMINI_BREAKER_COOLDOWN
+)
+
+# Last good Gemini result per request, served while the breaker is open
+gemini_response_cache = OrderedDict()
+
+def gemini_cache_key(kind: str, payload: dict):
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return f"{kind}:{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+def get_cached_gemini_result(key: str):
+    result = gemini_response_cache.get(key)
+    if result is not None:
+        gemini_response_cache.move_to_end(key)
+    return result
+
+def cache_gemini_result(key: str, result: dict):
+    gemini_response_cache[key] = result
+    gemini_response_cache.move_to_end(key)
+    while len(gemini_response_cache) > GEMINI_CACHE_SIZE:
+        gemini_response_cache.popitem(last=False)
+
+# Gemini calls get their own bounded pool: a cancelled run_in_executor future
+# doesn't stop its thread, so slow calls must not starve the default executor
+gemini_executor = ThreadPoolExecutor(max_workers=GEMINI_MAX_WORKERS, thread_name_prefix="gemini")
+_gemini_executor_state = {"busy": 0}
+_gemini_executor_lock = threading.Lock()
+
+def run_gemini_in_thread(model, prompt: str):
+    try:
+        return model.generate_content(prompt)
+    finally:
+        with _gemini_executor_lock:
+            _gemini_executor_state["busy"] -= 1
+
+def submit_gemini_call(loop, model, prompt: str):
+    with _gemini_executor_lock:
+        _gemini_executor_state["busy"] += 1
+    return loop.run_in_executor(gemini_executor, run_gemini_in_thread, model, prompt)
+
+def gemini_executor_saturated():
+    with _gemini_executor_lock:
+        return _gemini_executor_state["busy"] >= GEMINI_MAX_WORKERS
+
+async def generate_with_hedge(model, prompt: str):
+    # generate_content is blocking, so run it off the event loop. If hedging is
+    # on and the first call is slower than the recent latency percentile, fire
+    # a second identical call and take whichever succeeds first.
+    loop = asyncio.get_running_loop()
+    start = time.monotonic()
+    tasks = [submit_gemini_call(loop, model, prompt)]
+    hedge_delay = gemini_breaker.latency_percentile(GEMINI_HEDGE_PERCENTILE) if GEMINI_HEDGE_ENABLED else None
+    last_error = None
+
+    try:
+        while tasks:
+            remaining = GEMINI_TIMEOUT - (time.monotonic() - start)
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"Gemini call exceeded {GEMINI_TIMEOUT}s")
+            timeout = remaining
+            if hedge_delay is not None:
+                timeout = min(remaining, max(0.0, hedge_delay - (time.monotonic() - start)))
+
+            done, pending = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+            tasks = list(pending)
+
+            if hedge_delay is not None and not done:
+                # A hedge that would only queue behind other calls can't win
+                if not gemini_executor_saturated():
+                    gemini_breaker.hedged_requests += 1
+                    tasks.append(submit_gemini_call(loop, model, prompt))
+                hedge_delay = None
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    raise last_error
+
+async def call_gemini(prompt: str):
+    start = time.monotonic()
+    try:
+        model = genai.GenerativeModel('gemini-pro')
+        response = await generate_with_hedge(model, prompt)
+        response_text = response.text
+    except asyncio.CancelledError:
+        # Not a Gemini failure, but a half-open probe must not stay claimed
+        gemini_breaker.release_probe()
+        raise
+    except Exception:
+        gemini_breaker.record_failure(time.monotonic() - start)
+        raise
+    gemini_breaker.record_success(time.monotonic() - start)
+    return response_text
+
 async def generate_quiz_with_gemini(request: QuizRequest):
+    quiz = await fetch_quiz_from_gemini(request)
+    if quiz is not None:
+        return quiz
+    
+    # Fall back to the last good quiz for this request, then to mock data
+    return get_cached_gemini_result(gemini_cache_key("quiz", request.dict())) or mock_quiz_data(request)
+
+async def fetch_quiz_from_gemini(request: QuizRequest):
+    # Returns None whenever Gemini can't produce a quiz, so callers choose
+    # their own fallback
     if not GEMINI_API_KEY:
-        # Return mock data if no API key
-        return mock_quiz_data(request)
+        return None
+    
+    # Gemini is unhealthy, answer right away instead of waiting on it
+    if not gemini_breaker.allow_request():
+        return None
     
     try:
-        model = genai.GenerativeModel('gemini-pro')
-        
         # Create prompt based on request
         prompt = f"""
         Create a quiz for class {request.class_level} students on the topic of {request.topic} in {request.subject}.
@@ -262,11 +685,9 @@ async def generate_quiz_with_gemini(request: QuizRequest):
         The response should be in {request.language} language.
         """
         
-        response = model.generate_content(prompt)
+        response_text = await call_gemini(prompt)
         
         # Extract JSON from response
-        response_text = response.text
-        
         # Find JSON content between ```json and ```
         import re
         json_match = re.search(r'```json\n(.*?)\n```', response_text, re.DOTALL)
@@ -284,23 +705,21 @@ async def generate_quiz_with_gemini(request: QuizRequest):
             questions = json.loads(json_content)
             
             # Generate audio prompts
-            audio_prompts = {
-                "intro": f"Welcome to your {request.subject} quiz on {request.topic}",
-                "correct": "That's correct! Well done!",
-                "incorrect": "That's not quite right. Let's try again."
-            }
+            audio_prompts = get_quiz_audio_prompts(request)
             
-            return {
+            result = {
                 "questions": questions,
                 "audio_prompts": audio_prompts
             }
+            cache_gemini_result(gemini_cache_key("quiz", request.dict()), result)
+            return result
         except json.JSONDecodeError:
             logger.error(f"Failed to parse JSON from Gemini response: {response_text}")
-            return mock_quiz_data(request)
+            return None
             
     except Exception as e:
         logger.error(f"Error generating quiz with Gemini: {str(e)}")
-        return mock_quiz_data(request)
+        return None
 
 def mock_quiz_data(request: QuizRequest):
     # Mock data for when Gemini API is not available
@@ -337,11 +756,7 @@ def mock_quiz_data(request: QuizRequest):
             }
         ]
     
-    audio_prompts = {
-        "intro": f"Welcome to your {request.subject} quiz on {request.topic}",
-        "correct": "That's correct! Well done!",
-        "incorrect": "That's not quite right. Let's try again."
-    }
+    audio_prompts = get_quiz_audio_prompts(request)
     
     return {
         "questions": questions,
@@ -352,9 +767,15 @@ async def generate_mentor_response(request: MentorRequest):
     if not GEMINI_API_KEY:
         return mock_mentor_response(request)
     
+    cache_key = gemini_cache_key("mentor", {
+        "message": request.message,
+        "language": request.language,
+        "emotion": request.emotion
+    })
+    if not gemini_breaker.allow_request():
+        return get_cached_gemini_result(cache_key) or mock_mentor_response(request)
+    
     try:
-        model = genai.GenerativeModel('gemini-pro')
-        
         # Create context based on student emotion if available
         emotion_context = ""
         if request.emotion:
@@ -372,11 +793,9 @@ async def generate_mentor_response(request: MentorRequest):
         Also suggest 2-3 follow-up questions the student might want to ask.
         """
         
-        response = model.generate_content(prompt)
+        mentor_text = await call_gemini(prompt)
         
         # Process the response
-        mentor_text = response.text
-        
         # Extract suggestions (could be more sophisticated in production)
         suggestions = []
         if "follow-up" in mentor_text.lower() or "questions" in mentor_text.lower():
@@ -396,16 +815,16 @@ async def generate_mentor_response(request: MentorRequest):
                     sentences = re.split(r'[.!?]', suggestion_section)
                     suggestions = [s.strip() for s in sentences if s.strip()][:3]
         
-        # In a real app, would generate audio here
-        
-        return {
+        result = {
             "text_response": mentor_text.split("follow-up questions")[0] if "follow-up questions" in mentor_text.lower() else mentor_text,
             "suggestions": suggestions or ["What should I learn next?", "Can you explain this again?", "How does this apply to real life?"]
         }
+        cache_gemini_result(cache_key, result)
+        return result
             
     except Exception as e:
         logger.error(f"Error generating mentor response with Gemini: {str(e)}")
-        return mock_mentor_response(request)
+        return get_cached_gemini_result(cache_key) or mock_mentor_response(request)
 
 def mock_mentor_response(request: MentorRequest):
     # Mock data for when Gemini API is not available
@@ -420,6 +839,688 @@ def mock_mentor_response(request: MentorRequest):
             "suggestions": ["What should I learn next?", "Can you explain this again?", "How does this apply to real life?"]
         }
 
+# Offline lesson bundles: every lesson is split into content-addressed,
+# gzip-compressed chunks so clients only download what changed between builds
+BUNDLE_DIR = DATA_DIR / "bundles"
+BUNDLE_CHUNK_DIR = BUNDLE_DIR / "chunks"
+BUNDLE_MANIFEST_DIR = BUNDLE_DIR / "manifests"
+BUNDLE_QUIZ_DIR = BUNDLE_DIR / "quizzes"
+
+BUNDLE_RETRY_SECONDS = int(os.getenv("BUNDLE_RETRY_SECONDS", "300"))
+
+_bundle_state = {
+    "mtime": None,
+    "manifest_hash": None,
+    "manifest": None,
+    "provisional": False,  # some quizzes are mock placeholders for failed Gemini calls
+    "built_at": None,
+    "task": None,
+    "lock": None
+}
+
+def is_content_hash(value: str):
+    return len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+def canonical_json(data):
+    return json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def write_bundle_chunk(payload: bytes):
+    chunk_hash = hashlib.sha256(payload).hexdigest()
+    chunk_path = BUNDLE_CHUNK_DIR / f"{chunk_hash}.gz"
+    if not chunk_path.exists():
+        # mtime=0 keeps the compressed bytes stable across builds
+        compressed = gzip.compress(payload, mtime=0)
+        tmp_path = chunk_path.with_suffix(".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp_path, chunk_path)
+    return {
+        "hash": chunk_hash,
+        "size": len(payload),
+        "compressed_size": chunk_path.stat().st_size
+    }
+
+async def get_bundle_quiz(lesson: dict, lesson_key: str, language: str):
+    # Real Gemini quizzes are generated once per lesson and language and then
+    # reused so their chunk hash doesn't change on every rebuild. Returns the
+    # quiz and whether a later build should retry Gemini for it.
+    quiz_path = BUNDLE_QUIZ_DIR / f"{hashlib.sha256(f'{lesson_key}/{language}'.encode('utf-8')).hexdigest()}.json"
+    if quiz_path.exists():
+        with open(quiz_path, 'r', encoding='utf-8') as f:
+            return json.load(f), False
+    
+    request = QuizRequest(
+        subject=lesson.get("subject", ""),
+        topic=lesson.get("title", lesson.get("subject", "")),
+        difficulty="medium",
+        regional_context=lesson.get("region"),
+        language=language,
+        class_level=lesson.get("class_level", 5)
+    )
+    quiz = await fetch_quiz_from_gemini(request)
+    if quiz is None:
+        # Ship the mock for now but never persist it. Without an API key a
+        # retry can't do any better, so only failed calls are retried.
+        return mock_quiz_data(request), bool(GEMINI_API_KEY)
+    
+    tmp_path = quiz_path.with_suffix(".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(quiz, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, quiz_path)
+    return quiz, False
+
+async def build_lesson_bundles():
+    for directory in (BUNDLE_CHUNK_DIR, BUNDLE_MANIFEST_DIR, BUNDLE_QUIZ_DIR):
+        directory.mkdir(parents=True, exist_ok=True)
+    
+    lessons = []
+    provisional = False
+    for lesson in get_syllabus_map():
+        lesson_key = f"{lesson.get('region')}/{lesson.get('class_level')}/{lesson.get('subject')}"
+        chunks = []
+        
+        for language, content in sorted(lesson.get("content", {}).items()):
+            chunk = write_bundle_chunk(content.encode("utf-8"))
+            chunk.update({"kind": "content", "language": language, "media_type": "text/markdown"})
+            chunks.append(chunk)
+            
+            quiz, retry = await get_bundle_quiz(lesson, lesson_key, language)
+            provisional = provisional or retry
+            chunk = write_bundle_chunk(canonical_json(quiz))
+            chunk.update({"kind": "quiz", "language": language, "media_type": "application/json"})
+            chunks.append(chunk)
+        
+        chunk = write_bundle_chunk(canonical_json(lesson.get("resources", [])))
+        chunk.update({"kind": "resources", "language": None, "media_type": "application/json"})
+        chunks.append(chunk)
+        
+        lessons.append({
+            "key": lesson_key,
+            "region": lesson.get("region"),
+            "class_level": lesson.get("class_level"),
+            "subject": lesson.get("subject"),
+            "title": lesson.get("title"),
+            "video_url": lesson.get("video_url", {}),
+            "chunks": chunks
+        })
+    
+    manifest = {"lessons": lessons}
+    manifest_hash = hashlib.sha256(canonical_json(manifest)).hexdigest()
+    manifest_path = BUNDLE_MANIFEST_DIR / f"{manifest_hash}.json"
+    if not manifest_path.exists():
+        # Old manifests are kept so clients on any earlier build can get a delta
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+    
+    logger.info(f"Built lesson bundles for {len(lessons)} lessons, manifest {manifest_hash[:12]}")
+    return manifest_hash, manifest, provisional
+
+def syllabus_mtime():
+    syllabus_path = DATA_DIR / "syllabus_map.json"
+    return syllabus_path.stat().st_mtime_ns if syllabus_path.exists() else None
+
+def lesson_bundles_stale():
+    # Rebuild when the syllabus store changes on disk, or periodically while
+    # mock quizzes are standing in for Gemini ones
+    if _bundle_state["manifest"] is None or _bundle_state["mtime"] != syllabus_mtime():
+        return True
+    return _bundle_state["provisional"] and time.monotonic() - _bundle_state["built_at"] >= BUNDLE_RETRY_SECONDS
+
+async def refresh_lesson_bundles():
+    if _bundle_state["lock"] is None:
+        _bundle_state["lock"] = asyncio.Lock()
+    async with _bundle_state["lock"]:
+        if not lesson_bundles_stale():
+            return
+        mtime = syllabus_mtime()
+        try:
+            manifest_hash, manifest, provisional = await build_lesson_bundles()
+        except Exception as e:
+            logger.error(f"Error building lesson bundles: {str(e)}")
+            return
+        _bundle_state.update({
+            "mtime": mtime,
+            "manifest_hash": manifest_hash,
+            "manifest": manifest,
+            "provisional": provisional,
+            "built_at": time.monotonic()
+        })
+
+def schedule_lesson_bundle_refresh():
+    # At most one build runs at a time, in the background
+    task = _bundle_state["task"]
+    if task is None or task.done():
+        task = asyncio.ensure_future(refresh_lesson_bundles())
+        _bundle_state["task"] = task
+    return task
+
+async def get_lesson_bundles():
+    if lesson_bundles_stale():
+        task = schedule_lesson_bundle_refresh()
+        # Serve the previous build while a new one is made, only the very
+        # first request has to wait
+        if _bundle_state["manifest"] is None:
+            await asyncio.shield(task)
+    if _bundle_state["manifest"] is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Lesson bundles are not available yet"
+        )
+    return _bundle_state["manifest_hash"], _bundle_state["manifest"]
+
+def load_bundle_manifest(manifest_hash: str):
+    # Hashes are hex digests, reject anything else before touching the disk
+    if not is_content_hash(manifest_hash):
+        return None
+    manifest_path = BUNDLE_MANIFEST_DIR / f"{manifest_hash}.json"
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def manifest_chunk_hashes(manifest: dict):
+    return {chunk["hash"] for lesson in manifest.get("lessons", []) for chunk in lesson["chunks"]}
+
+# Adaptive-bitrate (HLS) transcoding of lesson videos. Output directories are
+# named by the source's content hash, so a changed video gets new renditions
+# and anything already transcoded is skipped after a restart.
+PUBLIC_DIR = Path(os.getenv("PUBLIC_DIR", "../public"))
+LESSONS_DIR = PUBLIC_DIR / "lessons"
+# Renditions are produced at runtime, so the backend serves them itself
+# rather than relying on Next.js, which only serves public/ as of build time
+HLS_DIR = DATA_DIR / "hls"
+# Scratch space lives outside the mounted tree so half-written renditions are
+# never served, but on the same filesystem so os.replace stays atomic
+HLS_WORK_DIR = DATA_DIR / "hls_work"
+HLS_URL_PREFIX = "/api/v1/hls"
+HLS_INDEX_PATH = DATA_DIR / "hls_index.json"
+HLS_WORKERS = int(os.getenv("HLS_WORKERS", "1"))
+HLS_SCAN_INTERVAL = int(os.getenv("HLS_SCAN_INTERVAL", "300"))
+HLS_SEGMENT_SECONDS = 6
+HLS_RENDITIONS = [
+    # name, height, video bitrate (kbps), audio bitrate (kbps)
+    ("240p", 240, 400, 64),
+    ("360p", 360, 800, 96),
+    ("480p", 480, 1400, 128),
+    ("720p", 720, 2800, 128),
+]
+# H.264 Main@3.1 (enough for 720p30) and AAC-LC, matching the ffmpeg flags below
+HLS_VIDEO_CODEC = "avc1.4d401f"
+HLS_AUDIO_CODEC = "mp4a.40.2"
+
+HLS_DIR.mkdir(parents=True, exist_ok=True)
+app.mount(HLS_URL_PREFIX, StaticFiles(directory=HLS_DIR), name="hls")
+
+hls_queue = asyncio.Queue()
+_hls_index = {}  # video url -> {"hash", "size", "mtime", "status"}
+_hls_queued = set()
+
+def load_hls_index():
+    if HLS_INDEX_PATH.exists():
+        with open(HLS_INDEX_PATH, 'r', encoding='utf-8') as f:
+            _hls_index.update(json.load(f))
+
+def save_hls_index():
+    tmp_path = HLS_INDEX_PATH.with_suffix(".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(_hls_index, f, indent=2)
+    os.replace(tmp_path, HLS_INDEX_PATH)
+
+def hash_file(path: Path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def get_hls_url(video_url: str):
+    entry = _hls_index.get(video_url)
+    if entry and entry.get("status") == "ready":
+        return f"{HLS_URL_PREFIX}/{entry['hash']}/master.m3u8"
+    return None
+
+async def scan_lesson_videos():
+    loop = asyncio.get_running_loop()
+    for source in sorted(LESSONS_DIR.rglob("*.mp4")):
+        video_url = "/" + source.relative_to(PUBLIC_DIR).as_posix()
+        stat = source.stat()
+        entry = _hls_index.get(video_url)
+        # Only rehash when size or mtime moved
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+            content_hash = entry["hash"]
+        else:
+            content_hash = await loop.run_in_executor(None, hash_file, source)
+        
+        if (HLS_DIR / content_hash / "master.m3u8").exists():
+            status_value = "ready"
+        elif entry and entry["hash"] == content_hash and entry["status"] == "failed":
+            # Don't retry a broken source until it changes
+            status_value = "failed"
+        else:
+            status_value = "pending"
+        _hls_index[video_url] = {
+            "hash": content_hash,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "status": status_value
+        }
+        if status_value == "pending" and content_hash not in _hls_queued:
+            _hls_queued.add(content_hash)
+            await hls_queue.put((video_url, source, content_hash))
+    save_hls_index()
+
+async def probe_video(source: Path):
+    # Returns (width, height, has_audio) for the source
+    process = await asyncio.create_subprocess_exec(
+        "ffprobe", "-v", "error", "-show_entries", "stream=codec_type,width,height",
+        "-of", "json", str(source),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffprobe failed: {stderr.decode(errors='replace').strip()}")
+    
+    streams = json.loads(stdout).get("streams", [])
+    video = next((stream for stream in streams if stream.get("codec_type") == "video"), None)
+    if not video or not video.get("width") or not video.get("height"):
+        raise RuntimeError("No video stream found")
+    has_audio = any(stream.get("codec_type") == "audio" for stream in streams)
+    return int(video["width"]), int(video["height"]), has_audio
+
+async def transcode_to_hls(source: Path, content_hash: str):
+    source_width, source_height, has_audio = await probe_video(source)
+    
+    # Never upscale, a source shorter than the smallest rung gets one
+    # rendition at its own height
+    renditions = [r for r in HLS_RENDITIONS if r[1] <= source_height]
+    if not renditions:
+        name, _, video_kbps, audio_kbps = HLS_RENDITIONS[0]
+        renditions = [(name, source_height - source_height % 2, video_kbps, audio_kbps)]
+    
+    # Render into a scratch directory and rename it into place at the end so a
+    # crash never leaves a half-written playlist that looks finished
+    output_dir = HLS_DIR / content_hash
+    work_dir = HLS_WORK_DIR / content_hash
+    shutil.rmtree(work_dir, ignore_errors=True)
+    work_dir.mkdir(parents=True)
+    
+    codecs = f"{HLS_VIDEO_CODEC},{HLS_AUDIO_CODEC}" if has_audio else HLS_VIDEO_CODEC
+    audio_args = ["-map", "0:a:0", "-c:a", "aac", "-ac", "2"] if has_audio else ["-an"]
+    
+    master_lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+    for name, height, video_kbps, audio_kbps in renditions:
+        # Keep the aspect ratio with an even width, as libx264 requires
+        width = max(2, int(round(source_width * height / source_height / 2)) * 2)
+        rendition_dir = work_dir / name
+        rendition_dir.mkdir()
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-y", "-loglevel", "error", "-i", str(source),
+            "-map", "0:v:0", "-vf", f"scale={width}:{height}",
+            "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "main", "-level", "3.1",
+            "-b:v", f"{video_kbps}k", "-maxrate", f"{int(video_kbps * 1.07)}k", "-bufsize", f"{int(video_kbps * 1.5)}k",
+            "-g", "48", "-keyint_min", "48", "-sc_threshold", "0",
+            *audio_args, *(["-b:a", f"{audio_kbps}k"] if has_audio else []),
+            "-f", "hls", "-hls_time", str(HLS_SEGMENT_SECONDS), "-hls_playlist_type", "vod",
+            "-hls_segment_filename", str(rendition_dir / "segment_%04d.ts"),
+            str(rendition_dir / "index.m3u8"),
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            raise RuntimeError(f"ffmpeg failed for {name}: {stderr.decode(errors='replace').strip()}")
+        
+        bandwidth = (video_kbps + (audio_kbps if has_audio else 0)) * 1000
+        master_lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={width}x{height},CODECS="{codecs}"')
+        master_lines.append(f"{name}/index.m3u8")
+    
+    with open(work_dir / "master.m3u8", 'w', encoding='utf-8') as f:
+        f.write("\n".join(master_lines) + "\n")
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(work_dir, output_dir)
+
+async def hls_worker():
+    while True:
+        video_url, source, content_hash = await hls_queue.get()
+        try:
+            logger.info(f"Transcoding {video_url} to HLS")
+            await transcode_to_hls(source, content_hash)
+            status_value = "ready"
+        except Exception as e:
+            logger.error(f"Error transcoding {video_url}: {str(e)}")
+            status_value = "failed"
+        finally:
+            _hls_queued.discard(content_hash)
+            hls_queue.task_done()
+        
+        # The source may have changed again while we were busy
+        entry = _hls_index.get(video_url)
+        if entry and entry["hash"] == content_hash:
+            entry["status"] = status_value
+            save_hls_index()
+
+async def hls_scanner():
+    while True:
+        try:
+            await scan_lesson_videos()
+        except Exception as e:
+            logger.error(f"Error scanning lesson videos: {str(e)}")
+        await asyncio.sleep(HLS_SCAN_INTERVAL)
+
+# Server-side text to speech with espeak-ng. Audio is encoded to Ogg/Opus with
+# ffmpeg when available and cached on disk under hash(text, language, voice),
+# evicting least recently used files once a cache passes its size budget.
+# Prompts and one-off mentor replies get separate budgets so unique replies
+# can't push the pre-rendered prompts out.
+TTS_DIR = DATA_DIR / "tts"
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+TTS_REPLY_CACHE_MAX_BYTES = int(os.getenv("TTS_REPLY_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+TTS_VOICES = {"english": "en", "telugu": "te", "hindi": "hi"}
+TTS_ENGINE = shutil.which("espeak-ng")
+TTS_ENCODER = shutil.which("ffmpeg")
+TTS_FORMAT, TTS_MEDIA_TYPE = ("ogg", "audio/ogg") if TTS_ENCODER else ("wav", "audio/wav")
+
+class SpeechCache:
+    """Size-bounded LRU of rendered speech files in one directory."""
+
+    def __init__(self, name: str, directory: Path, max_bytes: int):
+        self.name = name
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # audio hash -> size in bytes, least recently used first
+        self.total_bytes = 0
+
+    def __contains__(self, audio_hash: str):
+        return audio_hash in self.entries
+
+    def path(self, audio_hash: str):
+        return self.directory / f"{audio_hash}.{TTS_FORMAT}"
+
+    def load(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # File mtimes record last use, so LRU order survives restarts
+        for path in sorted(self.directory.glob(f"*.{TTS_FORMAT}"), key=lambda p: p.stat().st_mtime):
+            size = path.stat().st_size
+            self.entries[path.stem] = size
+            self.total_bytes += size
+        self._evict()
+
+    async def read(self, audio_hash: str):
+        # Returns None if the file was evicted in the meantime
+        if audio_hash not in self.entries:
+            return None
+        try:
+            async with aiofiles.open(self.path(audio_hash), 'rb') as f:
+                audio = await f.read()
+        except FileNotFoundError:
+            self._discard(audio_hash)
+            return None
+        if audio_hash in self.entries:
+            self.entries.move_to_end(audio_hash)
+            os.utime(self.path(audio_hash))
+        return audio
+
+    async def add(self, audio_hash: str, audio: bytes):
+        path = self.path(audio_hash)
+        tmp_path = path.with_suffix(".tmp")
+        async with aiofiles.open(tmp_path, 'wb') as f:
+            await f.write(audio)
+        os.replace(tmp_path, path)
+        
+        self._discard(audio_hash)
+        self.entries[audio_hash] = len(audio)
+        self.total_bytes += len(audio)
+        self._evict()
+
+    def _discard(self, audio_hash: str):
+        size = self.entries.pop(audio_hash, None)
+        if size is not None:
+            self.total_bytes -= size
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            audio_hash, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                self.path(audio_hash).unlink()
+            except FileNotFoundError:
+                pass
+
+tts_prompt_cache = SpeechCache("prompts", TTS_DIR / "prompts", TTS_CACHE_MAX_BYTES)
+tts_reply_cache = SpeechCache("replies", TTS_DIR / "replies", TTS_REPLY_CACHE_MAX_BYTES)
+_tts_inflight = {}
+
+async def render_speech(text: str, voice: str):
+    espeak = await asyncio.create_subprocess_exec(
+        TTS_ENGINE, "-v", voice, "--stdin", "--stdout",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    audio, stderr = await espeak.communicate(text.encode("utf-8"))
+    if espeak.returncode != 0:
+        logger.error(f"espeak-ng failed: {stderr.decode(errors='replace').strip()}")
+        return None
+    
+    if TTS_ENCODER:
+        encoder = await asyncio.create_subprocess_exec(
+            TTS_ENCODER, "-loglevel", "error", "-f", "wav", "-i", "pipe:0",
+            "-c:a", "libopus", "-b:a", "24k", "-f", "ogg", "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        audio, stderr = await encoder.communicate(audio)
+        if encoder.returncode != 0:
+            logger.error(f"Error encoding speech: {stderr.decode(errors='replace').strip()}")
+            return None
+    
+    return audio
+
+async def render_and_cache_speech(text: str, voice: str, audio_hash: str, cache: SpeechCache):
+    audio = await render_speech(text, voice)
+    if audio:
+        await cache.add(audio_hash, audio)
+    return audio
+
+async def synthesize_speech(text: str, language: str = "english", cache: SpeechCache = tts_prompt_cache):
+    # Returns (audio hash, audio bytes), or (None, None) when speech isn't
+    # available. The bytes come back directly so callers never have to reopen
+    # a file that a concurrent render may already have evicted.
+    if not TTS_ENGINE or not text or not text.strip():
+        return None, None
+    
+    language = language.lower()
+    voice = TTS_VOICES.get(language, TTS_VOICES["english"])
+    audio_hash = hashlib.sha256(f"{text}\0{language}\0{voice}".encode("utf-8")).hexdigest()
+    
+    audio = await cache.read(audio_hash)
+    if audio is not None:
+        return audio_hash, audio
+    
+    # Share one synthesis between concurrent requests for the same phrase
+    inflight_key = (cache.name, audio_hash)
+    task = _tts_inflight.get(inflight_key)
+    if task is None:
+        task = asyncio.ensure_future(render_and_cache_speech(text, voice, audio_hash, cache))
+        _tts_inflight[inflight_key] = task
+        task.add_done_callback(lambda _: _tts_inflight.pop(inflight_key, None))
+    
+    try:
+        audio = await asyncio.shield(task)
+    except Exception as e:
+        logger.error(f"Error synthesizing speech: {str(e)}")
+        return None, None
+    return (audio_hash, audio) if audio else (None, None)
+
+async def synthesize_prompt_urls(prompts: Dict[str, str], language: str):
+    keys = list(prompts)
+    results = await asyncio.gather(*(synthesize_speech(prompts[key], language) for key in keys))
+    return {key: f"/api/v1/tts/{audio_hash}" for key, (audio_hash, _) in zip(keys, results) if audio_hash}
+
+async def prerender_fixed_prompts():
+    for prompts in QUIZ_FEEDBACK_PROMPTS.values():
+        for language, text in prompts.items():
+            await synthesize_speech(text, language)
+    logger.info("Pre-rendered fixed quiz prompts")
+
+# Live emotion tracking: one fixed-size, array-backed ring buffer per active
+# student. Smoothed state is updated on every insert and mentors subscribed to
+# the student's region/class are pushed only the state transitions.
+EMOTION_BUFFER_SIZE = int(os.getenv("EMOTION_BUFFER_SIZE", "30"))
+EMOTION_MIN_READINGS = int(os.getenv("EMOTION_MIN_READINGS", "3"))
+EMOTION_SUSTAIN_RATIO = float(os.getenv("EMOTION_SUSTAIN_RATIO", "0.6"))
+EMOTION_IDLE_SECONDS = int(os.getenv("EMOTION_IDLE_SECONDS", "900"))
+EMOTION_MAX_STUDENTS = int(os.getenv("EMOTION_MAX_STUDENTS", "10000"))
+EMOTION_SUBSCRIBER_QUEUE = 100
+EMOTION_VIEWER_ROLES = ("mentor", "school")
+# The seven emotions DeepFace reports
+EMOTION_LABELS = ["neutral", "happy", "sad", "angry", "fear", "disgust", "surprise"]
+EMOTION_CODES = {label: code for code, label in enumerate(EMOTION_LABELS)}
+# Classroom states DeepFace has no label for, derived from a sustained mix of
+# its emotions when no single emotion dominates the window:
+# state, contributing emotions, emotion that must hold EMOTION_DERIVED_MIN_SHARE
+EMOTION_DERIVED_STATES = [
+    ("confused", ("fear", "surprise"), None),
+    ("tired", ("sad", "neutral"), "sad"),
+]
+EMOTION_DERIVED_MIN_SHARE = 0.3
+
+class EmotionRingBuffer:
+    """Last N emotion readings for one student plus a smoothed state.
+
+    Per-emotion confidence sums over the window are kept up to date as
+    readings enter and leave, so smoothing costs O(labels) per insert. A new
+    state is only adopted once it holds EMOTION_SUSTAIN_RATIO of the window's
+    confidence, which filters out single-frame flickers.
+    """
+
+    def __init__(self, student_id: str, name: str, region: Optional[str], class_level: Optional[int], size: int):
+        self.student_id = student_id
+        self.name = name
+        self.region = region
+        self.class_level = class_level
+        self.timestamps = np.zeros(size, dtype=np.float64)
+        self.emotions = np.zeros(size, dtype=np.int8)
+        self.confidences = np.zeros(size, dtype=np.float32)
+        self.weights = np.zeros(len(EMOTION_LABELS), dtype=np.float64)
+        self.head = 0
+        self.count = 0
+        self.state = "neutral"
+        self.last_seen = time.time()
+
+    def append(self, emotion: str, confidence: float, timestamp: float):
+        # Returns the previous state when this reading changes the smoothed state
+        code = EMOTION_CODES.get(emotion.lower(), EMOTION_CODES["neutral"])
+        size = len(self.emotions)
+        if self.count == size:
+            evicted = self.emotions[self.head]
+            self.weights[evicted] = max(0.0, self.weights[evicted] - float(self.confidences[self.head]))
+        else:
+            self.count += 1
+        
+        self.timestamps[self.head] = timestamp
+        self.emotions[self.head] = code
+        self.confidences[self.head] = confidence
+        self.weights[code] += float(self.confidences[self.head])
+        self.head = (self.head + 1) % size
+        self.last_seen = timestamp
+        
+        previous = self.state
+        total = self.weights.sum()
+        if self.count >= EMOTION_MIN_READINGS and total > 0:
+            self.state = self._smoothed_state(self.weights / total)
+        return previous if self.state != previous else None
+
+    def _smoothed_state(self, shares):
+        leader = int(shares.argmax())
+        if shares[leader] >= EMOTION_SUSTAIN_RATIO:
+            return EMOTION_LABELS[leader]
+        for state, members, required in EMOTION_DERIVED_STATES:
+            if sum(shares[EMOTION_CODES[m]] for m in members) < EMOTION_SUSTAIN_RATIO:
+                continue
+            if required is None or shares[EMOTION_CODES[required]] >= EMOTION_DERIVED_MIN_SHARE:
+                return state
+        # Nothing sustained, keep the previous state
+        return self.state
+
+    def readings(self):
+        size = len(self.emotions)
+        start = (self.head - self.count) % size
+        order = [(start + i) % size for i in range(self.count)]
+        return [
+            EmotionData(
+                timestamp=datetime.utcfromtimestamp(self.timestamps[i]).isoformat(),
+                emotion=EMOTION_LABELS[self.emotions[i]],
+                confidence=float(self.confidences[i])
+            )
+            for i in order
+        ]
+
+    def summary(self):
+        return {
+            "student_id": self.student_id,
+            "student_name": self.name,
+            "region": self.region,
+            "class_level": self.class_level,
+            "state": self.state,
+            "readings": self.count,
+            "last_seen": datetime.utcfromtimestamp(self.last_seen).isoformat()
+        }
+
+_emotion_buffers = OrderedDict()  # student id -> EmotionRingBuffer, least recently active first
+_emotion_subscribers = []
+
+def emotion_scope_matches(scope: dict, region: Optional[str], class_level: Optional[int]):
+    return scope["region"] == region and scope["class_level"] in (None, class_level)
+
+def evict_inactive_emotion_buffers(now: float):
+    while _emotion_buffers:
+        oldest = next(iter(_emotion_buffers.values()))
+        if len(_emotion_buffers) <= EMOTION_MAX_STUDENTS and now - oldest.last_seen <= EMOTION_IDLE_SECONDS:
+            break
+        _emotion_buffers.popitem(last=False)
+
+def publish_emotion_event(event: dict, region: Optional[str], class_level: Optional[int]):
+    for subscriber in _emotion_subscribers:
+        if not emotion_scope_matches(subscriber, region, class_level):
+            continue
+        queue = subscriber["queue"]
+        # Slow consumers lose their oldest events rather than growing memory
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+def record_emotion(student_id: str, student: Optional[dict], emotion: str, confidence: float):
+    now = time.time()
+    buffer = _emotion_buffers.get(student_id)
+    if buffer is None:
+        student = student or {}
+        buffer = EmotionRingBuffer(
+            student_id,
+            student.get("name", "Unknown"),
+            student.get("region"),
+            student.get("class_level"),
+            EMOTION_BUFFER_SIZE
+        )
+        _emotion_buffers[student_id] = buffer
+    else:
+        _emotion_buffers.move_to_end(student_id)
+    
+    # DeepFace reports confidence as a percentage
+    if confidence > 1:
+        confidence = confidence / 100
+    previous = buffer.append(emotion, confidence, now)
+    evict_inactive_emotion_buffers(now)
+    
+    if previous is not None:
+        event = buffer.summary()
+        event["previous_state"] = previous
+        publish_emotion_event(event, buffer.region, buffer.class_level)
+    return buffer.state
+
 # Routes
 @app.post("/api/v1/auth/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
@@ -456,11 +1557,17 @@ async def generate_quiz(
     request: QuizRequest,
     current_user: User = Depends(get_current_user)
 ):
-    quiz_data = await generate_quiz_with_gemini(request)
+    # Copy so the Gemini fallback cache isn't mutated
+    quiz_data = dict(await generate_quiz_with_gemini(request))
+    quiz_data["audio_urls"] = await synthesize_prompt_urls(quiz_data.get("audio_prompts") or {}, request.language)
     return quiz_data
 
 @app.post("/api/v1/face-auth")
-async def face_authentication(file: UploadFile = File(...), student_id: str = Form(...)):
+async def face_authentication(
+    file: UploadFile = File(...),
+    student_id: str = Form(...),
+    current_user: Optional[User] = Depends(get_optional_user)
+):
     try:
         # Save the uploaded file temporarily
         temp_file_path = f"temp_{file.filename}"
@@ -487,13 +1594,18 @@ async def face_authentication(file: UploadFile = File(...), student_id: str = Fo
         # Get appropriate response based on emotion and language
         response_text = get_emotion_response(emotion, language)
         
-        # In a real app, would log emotion to database
+        # Track the reading for live mentor dashboards, only from the student
+        # themselves so nobody can push fake readings into a mentor's feed
+        smoothed_state = None
+        if student and current_user and current_user.id == student_id:
+            smoothed_state = record_emotion(student_id, student, emotion, float(emotion_scores[emotion]))
         
         return {
             "emotion": emotion,
             "confidence": emotion_scores[emotion],
             "response": response_text,
-            "all_emotions": emotion_scores
+            "all_emotions": emotion_scores,
+            "smoothed_state": smoothed_state
         }
     except Exception as e:
         logger.error(f"Error processing image: {str(e)}")
@@ -502,6 +1614,74 @@ async def face_authentication(file: UploadFile = File(...), student_id: str = Fo
             detail=f"Error processing image: {str(e)}"
         )
 
+@app.get("/api/v1/emotions/stream")
+async def stream_emotions(
+    request: Request,
+    class_level: Optional[int] = None,
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role not in EMOTION_VIEWER_ROLES:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view student emotions"
+        )
+    
+    scope = {"region": current_user.region, "class_level": class_level}
+    
+    async def event_stream():
+        queue = asyncio.Queue(maxsize=EMOTION_SUBSCRIBER_QUEUE)
+        subscriber = dict(scope, queue=queue)
+        _emotion_subscribers.append(subscriber)
+        try:
+            # Current states first, then only transitions. Eviction otherwise
+            # only runs on new readings, so drop idle students before listing.
+            evict_inactive_emotion_buffers(time.time())
+            snapshot = [
+                buffer.summary() for buffer in _emotion_buffers.values()
+                if emotion_scope_matches(scope, buffer.region, buffer.class_level)
+            ]
+            yield f"event: snapshot\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+            
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: transition\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            _emotion_subscribers.remove(subscriber)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/v1/emotions/{student_id}", response_model=List[EmotionData])
+async def get_emotion_history(
+    student_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    student = get_student_roster().get(student_id)
+    if not student:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Student not found"
+        )
+    
+    # Students see their own history, staff only within their region like the stream
+    if current_user.id != student_id and (
+        current_user.role not in EMOTION_VIEWER_ROLES or student.get("region") != current_user.region
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to access this student's data"
+        )
+    
+    buffer = _emotion_buffers.get(student_id)
+    return buffer.readings() if buffer else []
+
 @app.post("/api/v1/voice-command")
 async def process_voice_command(request: VoiceCommandRequest):
     try:
@@ -564,9 +1744,33 @@ async def chat_with_mentor(
     request: MentorRequest,
     current_user: User = Depends(get_current_user)
 ):
-    response = await generate_mentor_response(request)
+    response = dict(await generate_mentor_response(request))
+    
+    _, audio = await synthesize_speech(response["text_response"], request.language, cache=tts_reply_cache)
+    if audio:
+        response["audio_response"] = base64.b64encode(audio).decode("ascii")
     return response
 
+# Not behind auth so <audio> elements can play it directly, the name is a
+# content hash that can't be derived without knowing the text
+@app.get("/api/v1/tts/{audio_hash}")
+async def get_tts_audio(audio_hash: str):
+    audio = await tts_prompt_cache.read(audio_hash) if is_content_hash(audio_hash) else None
+    if audio is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Audio not found"
+        )
+    
+    return Response(
+        content=audio,
+        media_type=TTS_MEDIA_TYPE,
+        headers={
+            "Cache-Control": "public, max-age=31536000, immutable",
+            "ETag": f'"{audio_hash}"'
+        }
+    )
+
 @app.get("/api/v1/lessons/{region}/{class_level}/{subject}/{language}")
 async def get_lesson(
     region: str,
@@ -601,14 +1805,95 @@ async def get_lesson(
         # Fallback to English
         content = lesson.get("content", {}).get("english", "Lesson content not available")
     
+    video_url = lesson.get("video_url", {}).get(language, lesson.get("video_url", {}).get("english", ""))
+    
     return {
         "title": lesson.get("title", f"{subject} for Class {class_level}"),
         "description": lesson.get("description", "Learn with VidyAI++"),
         "content": content,
-        "video_url": lesson.get("video_url", {}).get(language, lesson.get("video_url", {}).get("english", "")),
+        "video_url": video_url,
+        "hls_url": get_hls_url(video_url),
         "resources": lesson.get("resources", [])
     }
 
+@app.get("/api/v1/admin/gemini-breaker")
+async def get_gemini_breaker_state(current_user: User = Depends(get_current_admin)):
+    breaker_state = gemini_breaker.snapshot()
+    breaker_state["hedging"] = {
+        "enabled": GEMINI_HEDGE_ENABLED,
+        "percentile": GEMINI_HEDGE_PERCENTILE,
+        "delay_seconds": gemini_breaker.latency_percentile(GEMINI_HEDGE_PERCENTILE)
+    }
+    breaker_state["executor"] = {
+        "busy": _gemini_executor_state["busy"],
+        "max_workers": GEMINI_MAX_WORKERS
+    }
+    breaker_state["cached_responses"] = len(gemini_response_cache)
+    return breaker_state
+
+@app.get("/api/v1/bundles/manifest")
+async def get_bundle_manifest(current_user: User = Depends(get_current_user)):
+    manifest_hash, manifest = await get_lesson_bundles()
+    return {
+        "manifest_hash": manifest_hash,
+        "manifest": manifest
+    }
+
+@app.get("/api/v1/bundles/delta")
+async def get_bundle_delta(
+    since: Optional[str] = None,
+    include_data: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    manifest_hash, manifest = await get_lesson_bundles()
+    current_chunks = manifest_chunk_hashes(manifest)
+    
+    # Unknown or missing client manifests get a full download
+    client_manifest = load_bundle_manifest(since) if since else None
+    client_chunks = manifest_chunk_hashes(client_manifest) if client_manifest else set()
+    
+    missing = sorted(current_chunks - client_chunks)
+    delta = {
+        "manifest_hash": manifest_hash,
+        "up_to_date": since == manifest_hash,
+        "full_sync": client_manifest is None,
+        "manifest": manifest if since != manifest_hash else None,
+        "missing_chunks": missing,
+        "removed_chunks": sorted(client_chunks - current_chunks)
+    }
+    if include_data:
+        chunk_data = {}
+        for chunk_hash in missing:
+            with open(BUNDLE_CHUNK_DIR / f"{chunk_hash}.gz", 'rb') as f:
+                chunk_data[chunk_hash] = base64.b64encode(f.read()).decode("ascii")
+        delta["chunk_data"] = chunk_data
+    return delta
+
+@app.get("/api/v1/bundles/chunks/{chunk_hash}")
+async def get_bundle_chunk(
+    chunk_hash: str,
+    current_user: User = Depends(get_current_user)
+):
+    chunk_path = BUNDLE_CHUNK_DIR / f"{chunk_hash}.gz"
+    if not is_content_hash(chunk_hash) or not chunk_path.exists():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Chunk not found"
+        )
+    
+    async with aiofiles.open(chunk_path, 'rb') as f:
+        compressed = await f.read()
+    
+    # Chunks are immutable, so clients can cache them forever
+    return Response(
+        content=compressed,
+        media_type="application/gzip",
+        headers={
+            "Cache-Control": "private, max-age=31536000, immutable",
+            "ETag": f'"{chunk_hash}"'
+        }
+    )
+
 @app.get("/api/v1/skill-map/{student_id}")
 async def get_skill_map(
     student_id: str,
@@ -635,19 +1920,15 @@ async def get_skill_map(
         )
     
     # Generate skill heatmap data
-    subjects = ["Math", "Science", "Language", "History", "Geography"]
-    skills = ["Understanding", "Application", "Analysis", "Creation", "Evaluation"]
+    scores = generate_skill_scores(1)[0]
     
     heatmap_data = []
-    for subject in subjects:
+    for i, subject in enumerate(SKILL_SUBJECTS):
         subject_data = []
-        for skill in skills:
-            # Generate a random score between 30 and 100 for demo purposes
-            # In a real app, this would be calculated from actual performance data
-            score = np.random.randint(30, 100)
+        for j, skill in enumerate(SKILL_NAMES):
             subject_data.append({
                 "skill": skill,
-                "score": score
+                "score": int(scores[i][j])
             })
         heatmap_data.append({
             "subject": subject,
@@ -661,6 +1942,61 @@ async def get_skill_map(
         "skill_heatmap": heatmap_data
     }
 
+@app.get("/api/v1/students")
+async def list_students(
+    region: Optional[str] = None,
+    class_level: Optional[int] = None,
+    preferred_language: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    fields: Optional[str] = None,
+    include_skills: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role not in ROSTER_ALLOWED_FIELDS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to list students"
+        )
+    
+    # Staff only see their own region, like the emotion endpoints
+    if region is None:
+        region = current_user.region
+    elif roster_index_key(region) != roster_index_key(current_user.region):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to list students in this region"
+        )
+    
+    projection = ROSTER_DEFAULT_FIELDS
+    if fields:
+        projection = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in projection if f not in ROSTER_ALLOWED_FIELDS[current_user.role]]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Fields not available: {', '.join(unknown)}"
+            )
+    
+    roster = get_student_roster()
+    after_id = decode_roster_cursor(cursor) if cursor else None
+    page, has_more, total = roster.query(
+        {"region": region, "class_level": class_level, "preferred_language": preferred_language},
+        after_id,
+        limit
+    )
+    
+    items = [{field: student.get(field) for field in projection} for student in page]
+    if include_skills and page:
+        for item, summary in zip(items, summarize_skill_scores(generate_skill_scores(len(page)))):
+            item["skill_summary"] = summary
+    
+    return {
+        "students": items,
+        "total": total,
+        "next_cursor": encode_roster_cursor(str(page[-1].get("id", ""))) if has_more else None
+    }
+
 @app.on_event("startup")
 async def startup_event():
     # Create sample data files if they don't exist
@@ -722,6 +2058,23 @@ async def startup_event():
         with open(mentors_path, 'w', encoding='utf-8') as f:
             json.dump(sample_mentors, f, indent=2)
     
+    # Create schools.json if it doesn't exist (school accounts use the admin dashboard)
+    schools_path = DATA_DIR / "schools.json"
+    if not schools_path.exists():
+        sample_schools = [
+            {
+                "id": "school1",
+                "username": "school1",
+                "password": "school123",
+                "name": "ZP High School Guntur",
+                "role": "school",
+                "region": "Andhra Pradesh",
+                "disabled": False
+            }
+        ]
+        with open(schools_path, 'w', encoding='utf-8') as f:
+            json.dump(sample_schools, f, indent=2)
+    
     # Create syllabus_map.json if it doesn't exist
     syllabus_path = DATA_DIR / "syllabus_map.json"
     if not syllabus_path.exists():
@@ -777,6 +2130,26 @@ async def startup_event():
             json.dump(sample_syllabus, f, indent=2)
     
     logger.info("Sample data files created successfully")
+    
+    # Pre-build offline lesson bundles in the background
+    schedule_lesson_bundle_refresh()
+    
+    # Load the speech caches and pre-render fixed prompts in the background
+    tts_prompt_cache.load()
+    tts_reply_cache.load()
+    if TTS_ENGINE:
+        asyncio.create_task(prerender_fixed_prompts())
+    else:
+        logger.warning("espeak-ng not found, text to speech disabled")
+    
+    # Start the HLS transcoding queue if ffmpeg is available
+    load_hls_index()
+    if shutil.which("ffmpeg") and shutil.which("ffprobe") and LESSONS_DIR.exists():
+        for _ in range(HLS_WORKERS):
+            asyncio.create_task(hls_worker())
+        asyncio.create_task(hls_scanner())
+    else:
+        logger.warning("ffmpeg, ffprobe or lessons directory not found, HLS transcoding disabled")
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,279 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+import pytest
+
+# main pulls in the full backend requirements (fastapi, deepface, opencv,
+# google-generativeai, ...); these tests only run where they are installed
+main = pytest.importorskip("main")
+
+
+def make_breaker(**overrides):
+    settings = dict(
+        window_size=10,
+        min_calls=1,
+        error_rate_threshold=0.5,
+        latency_threshold=60,
+        cooldown=0
+    )
+    settings.update(overrides)
+    return main.CircuitBreaker("test", **settings)
+
+
+def test_percentile_is_nearest_rank():
+    assert main.percentile([1, 2, 3, 4, 5], 0.5) == 3
+    assert main.percentile([1, 2, 3, 4, 5], 0.95) == 5
+    assert main.percentile([], 0.5) is None
+
+
+def test_cancelled_half_open_probe_releases_breaker(monkeypatch):
+    breaker = make_breaker()
+    breaker.record_failure(0.1)
+    assert breaker.state == "open"
+
+    async def hang(model, prompt):
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(main, "gemini_breaker", breaker)
+    monkeypatch.setattr(main, "generate_with_hedge", hang)
+    monkeypatch.setattr(main.genai, "GenerativeModel", lambda name: None)
+
+    async def cancel_probe():
+        assert breaker.allow_request()
+        probe = asyncio.ensure_future(main.call_gemini("prompt"))
+        await asyncio.sleep(0)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    asyncio.run(cancel_probe())
+
+    assert breaker.state == "half_open"
+    assert not breaker.probe_in_flight
+    assert breaker.allow_request()
+
+
+def test_hedged_request_fires_after_latency_percentile(monkeypatch):
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_success(0.05)
+
+    class SlowThenFastModel:
+        def __init__(self):
+            self.calls = 0
+
+        def generate_content(self, prompt):
+            self.calls += 1
+            if self.calls == 1:
+                time.sleep(1)
+                return "slow"
+            return "fast"
+
+    monkeypatch.setattr(main, "gemini_breaker", breaker)
+    monkeypatch.setattr(main, "GEMINI_HEDGE_ENABLED", True)
+    model = SlowThenFastModel()
+
+    assert asyncio.run(main.generate_with_hedge(model, "prompt")) == "fast"
+    assert model.calls == 2
+    assert breaker.hedged_requests == 1
+
+
+def test_open_breaker_serves_cached_quiz_before_mock(monkeypatch):
+    breaker = make_breaker(cooldown=3600)
+    breaker.record_failure(0.1)
+    assert breaker.state == "open"
+
+    monkeypatch.setattr(main, "GEMINI_API_KEY", "test-key")
+    monkeypatch.setattr(main, "gemini_breaker", breaker)
+    monkeypatch.setattr(main, "gemini_response_cache", OrderedDict())
+
+    cached_request = main.QuizRequest(subject="Math", topic="Fractions", difficulty="easy")
+    cached_quiz = {"questions": [{"question": "cached"}], "audio_prompts": {}}
+    main.cache_gemini_result(main.gemini_cache_key("quiz", cached_request.dict()), cached_quiz)
+
+    assert asyncio.run(main.generate_quiz_with_gemini(cached_request)) == cached_quiz
+
+    other_request = main.QuizRequest(subject="Science", topic="Planets", difficulty="easy")
+    assert asyncio.run(main.generate_quiz_with_gemini(other_request)) == main.mock_quiz_data(other_request)
+
+
+def test_failed_mentor_call_serves_cached_reply(monkeypatch):
+    async def fail(prompt):
+        raise RuntimeError("Gemini is down")
+
+    monkeypatch.setattr(main, "GEMINI_API_KEY", "test-key")
+    monkeypatch.setattr(main, "gemini_breaker", make_breaker())
+    monkeypatch.setattr(main, "gemini_response_cache", OrderedDict())
+    monkeypatch.setattr(main, "call_gemini", fail)
+
+    request = main.MentorRequest(message="What is a fraction?", student_id="student1")
+    cached_reply = {"text_response": "cached", "suggestions": []}
+    main.cache_gemini_result(main.gemini_cache_key("mentor", {
+        "message": request.message,
+        "language": request.language,
+        "emotion": request.emotion
+    }), cached_reply)
+
+    assert asyncio.run(main.generate_mentor_response(request)) == cached_reply
+
+
+def make_roster():
+    students = [
+        {
+            "id": f"student{i:02d}",
+            "name": f"Student {i}",
+            "region": "Andhra Pradesh" if i % 2 else "Telangana",
+            "class_level": 6 + i % 3,
+            "preferred_language": "telugu" if i % 4 else "english"
+        }
+        for i in range(20)
+    ]
+    return main.StudentRoster(students)
+
+
+def test_roster_cursor_continues_across_pages():
+    roster = make_roster()
+    seen = []
+    after_id = None
+    while True:
+        page, has_more, total = roster.query({}, after_id, 7)
+        seen.extend(s["id"] for s in page)
+        if not has_more:
+            break
+        after_id = main.decode_roster_cursor(main.encode_roster_cursor(page[-1]["id"]))
+
+    assert total == 20
+    assert seen == sorted(f"student{i:02d}" for i in range(20))
+
+
+def test_roster_cursor_id_not_in_set_resumes_after_it():
+    roster = make_roster()
+    page, _, _ = roster.query({}, "student04x", 3)
+    assert [s["id"] for s in page] == ["student05", "student06", "student07"]
+
+    page, has_more, _ = roster.query({"region": "telangana"}, "student05", 2)
+    assert [s["id"] for s in page] == ["student06", "student08"]
+    assert has_more
+
+
+def test_roster_intersects_filters():
+    roster = make_roster()
+    page, has_more, total = roster.query(
+        {"region": "Andhra Pradesh", "class_level": 7, "preferred_language": "TELUGU"},
+        None,
+        50
+    )
+    expected = [
+        f"student{i:02d}" for i in range(20)
+        if i % 2 and 6 + i % 3 == 7 and i % 4
+    ]
+    assert [s["id"] for s in page] == expected
+    assert total == len(expected)
+    assert not has_more
+
+    page, _, total = roster.query({"region": "Andhra Pradesh", "class_level": 99}, None, 50)
+    assert page == [] and total == 0
+
+
+@pytest.mark.parametrize("cursor", ["!!!", "abc", "%%%%", "é"])
+def test_malformed_roster_cursor_is_rejected(cursor):
+    with pytest.raises(main.HTTPException) as excinfo:
+        main.decode_roster_cursor(cursor)
+    assert excinfo.value.status_code == 400
+
+
+def test_summarize_skill_scores():
+    scores = main.np.zeros((2, len(main.SKILL_SUBJECTS), len(main.SKILL_NAMES)))
+    scores[0, 0, :] = 90
+    scores[0, 1:, :] = 50
+    scores[1, :, :] = 60
+    scores[1, 2, :] = 30
+
+    first, second = main.summarize_skill_scores(scores)
+    assert first["strongest_subject"] == main.SKILL_SUBJECTS[0]
+    assert first["subjects"][main.SKILL_SUBJECTS[0]] == 90
+    assert first["overall"] == 58.0
+    assert second["weakest_subject"] == main.SKILL_SUBJECTS[2]
+
+
+def test_bundle_quiz_without_api_key_is_not_retried(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "GEMINI_API_KEY", None)
+    monkeypatch.setattr(main, "BUNDLE_QUIZ_DIR", tmp_path)
+    lesson = {"region": "Andhra Pradesh", "class_level": 6, "subject": "Math", "title": "Fractions"}
+
+    quiz, retry = asyncio.run(main.get_bundle_quiz(lesson, "Andhra Pradesh/6/Math", "english"))
+
+    assert quiz["questions"]
+    assert not retry
+    assert list(tmp_path.iterdir()) == []
+
+
+def make_emotion_buffer(size=5):
+    return main.EmotionRingBuffer("student1", "Ravi Kumar", "Andhra Pradesh", 6, size)
+
+
+def feed(buffer, emotions, confidence=0.9):
+    transitions = []
+    for emotion in emotions:
+        previous = buffer.append(emotion, confidence, buffer.last_seen + 1)
+        if previous is not None:
+            transitions.append((previous, buffer.state))
+    return transitions
+
+
+def test_emotion_buffer_needs_a_sustained_majority():
+    buffer = make_emotion_buffer()
+    assert feed(buffer, ["happy", "happy"]) == []
+    assert buffer.state == "neutral"
+
+    # Third reading reaches EMOTION_MIN_READINGS with happy holding the window
+    assert feed(buffer, ["happy"]) == [("neutral", "happy")]
+
+    # A single sad frame is a flicker, not a transition
+    assert feed(buffer, ["sad"]) == []
+    assert buffer.state == "happy"
+
+
+def test_emotion_buffer_wraps_and_evicts_oldest():
+    buffer = make_emotion_buffer(size=5)
+    feed(buffer, ["happy"] * 5)
+    assert buffer.state == "happy"
+
+    transitions = feed(buffer, ["angry"] * 3)
+    assert transitions == [("happy", "angry")]
+    assert buffer.count == 5
+
+    readings = buffer.readings()
+    assert [r.emotion for r in readings] == ["happy", "happy", "angry", "angry", "angry"]
+    assert readings[-1].timestamp > readings[0].timestamp
+
+    # Window sums match what is actually left in the buffer
+    assert buffer.weights[main.EMOTION_CODES["happy"]] == pytest.approx(1.8)
+    assert buffer.weights[main.EMOTION_CODES["angry"]] == pytest.approx(2.7)
+
+
+def test_emotion_buffer_derives_confused_from_fear_and_surprise():
+    buffer = make_emotion_buffer(size=6)
+    feed(buffer, ["fear", "surprise"] * 3)
+    assert buffer.state == "confused"
+
+
+def test_emotion_buffer_derives_tired_from_sad_and_neutral():
+    buffer = make_emotion_buffer(size=6)
+    feed(buffer, ["happy"] * 6)
+    assert feed(buffer, ["sad", "neutral"] * 3) == [("happy", "tired")]
+
+    # Mostly neutral with too little sadness is just neutral
+    buffer = make_emotion_buffer(size=6)
+    feed(buffer, ["neutral", "neutral", "neutral", "sad", "happy", "happy"])
+    assert buffer.state == "neutral"
+
+
+def test_emotion_confidence_percentages_are_normalised(monkeypatch):
+    monkeypatch.setattr(main, "_emotion_buffers", OrderedDict())
+    monkeypatch.setattr(main, "_emotion_subscribers", [])
+    student = {"name": "Ravi Kumar", "region": "Andhra Pradesh", "class_level": 6}
+
+    main.record_emotion("student1", student, "happy", 95.0)
+    assert main._emotion_buffers["student1"].readings()[0].confidence == pytest.approx(0.95)